@@ -1,23 +1,225 @@
+import asyncio
 import pandas as pd
-import requests
-import time
+import aiohttp
+import diskcache
+import hashlib
+import weakref
 import fitz  # PyMuPDF
-from openai import OpenAI
-import urllib3
+import tiktoken
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI
 import re
 import os
+import socket
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-# Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from io import BytesIO
+from urllib.parse import urlparse
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 CSE_ID = os.getenv("CSE_ID")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client (async, so validations overlap with the rest
+# of the pipeline instead of blocking the event loop in a worker thread)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+# How many rows are processed concurrently
+MAX_CONCURRENT_ROWS = 10
+
+# Google CSE allows ~10 qps; keep concurrent searches under that
+SEARCH_CONCURRENCY = 10
+
+# How many rows are validated per OpenAI call
+VALIDATION_BATCH_SIZE = 8
+
+# First ~512 KB of a PDF is enough to parse page 1 in most cases
+PDF_RANGE_BYTES = 524288
+
+# Persistent caches shared across runs: Google CSE is rate-limited (100
+# queries/day on the free tier) and re-runs after fixing up a spreadsheet
+# repeat the same products, while identical PDF text need not re-hit OpenAI
+CSE_CACHE = diskcache.Cache(".cse_cache", size_limit=100_000_000)
+AI_CACHE = diskcache.Cache(".ai_cache", size_limit=100_000_000)
+CACHE_TTL = 7 * 86400
+
+def _ai_cache_key(text, product_name, apir_code):
+    return (hashlib.sha1(text[:15000].encode()).hexdigest(), product_name, apir_code)
+
+# ~2k tokens reliably covers a PDS first page's title/APIR/date; a 15000-char
+# slice could cost ~5k tokens of mostly marketing boilerplate per call
+VALIDATE_MAX_TOKENS = 2048
+try:
+    _ENCODER = tiktoken.encoding_for_model("gpt-4o-mini")
+except KeyError:
+    _ENCODER = tiktoken.get_encoding("o200k_base")
+
+def _truncate_tokens(text, max_tokens=VALIDATE_MAX_TOKENS):
+    """Trim text to max_tokens model tokens (chars are a poor proxy for tokens)."""
+    tokens = _ENCODER.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return _ENCODER.decode(tokens[:max_tokens])
+
+# Compiled once: filename-unsafe characters and the batch response format.
+# The batch pattern is matched one line at a time (never across the whole
+# response): a 0-score line legitimately has no date segment, and a
+# multi-line scan would swallow the next item's line as this item's date.
+_UNSAFE_CHARS = re.compile(r'[\\/*?:"<>|]')
+_RE_BATCH_LINE = re.compile(r"#(\d+)[ \t]*\|[ \t]*(\d+)[ \t]*\|[ \t]*([^|\n]*)\|?[ \t]*(.*)")
+
+def _resolve_quietly(host):
+    """Warm the OS resolver cache for a host; failures surface at fetch time."""
+    try:
+        socket.getaddrinfo(host, 443, proto=socket.IPPROTO_TCP)
+    except OSError:
+        pass
+
+def _safe_pdf_path(download_folder, product_name, apir_code=None):
+    """
+    Destination path for a product's PDF, with filename-unsafe chars
+    stripped. The APIR code is folded into the name when present, since
+    distinct products can share a product name.
+    """
+    name = _UNSAFE_CHARS.sub('', product_name)
+    if apir_code:
+        name = f"{name} ({_UNSAFE_CHARS.sub('', apir_code)})"
+    return os.path.join(download_folder, f"{name}.pdf")
+
+# Static validation rules, kept byte-identical across calls so OpenAI's
+# automatic prompt caching can serve the prefix. The variable parts
+# (product name, APIR code, PDF text) go in the user message instead.
+# OpenAI only caches prefixes longer than 1024 tokens, so the criteria are
+# written out in full with worked examples: the detail keeps both prompts
+# past that threshold as well as pinning down the edge cases.
+_PDS_CRITERIA = """Validation Criteria:
+1. Extract the PDS date.
+   - The date normally appears on the cover page near the document title, in the page footer, or in an "About this document" panel.
+   - Accept any common form: "1 July 2024", "1st July 2024", "01/07/2024", "July 2024" (treat as 1 July 2024), "Issued 1 July 2024", "Dated 1 July 2024", "Effective 1 July 2024", "Preparation date: 1 July 2024".
+   - If several dates appear (issue date, preparation date, commencement date, SPDS date), report the issue or preparation date of the PDS itself; ignore dates that belong to documents it incorporates by reference.
+   - Always report the date as D Month YYYY with no leading zero on the day.
+   - Never invent a date; if none can be found, omit the date segment and say "No PDS date found".
+2. Product name check.
+   - The document must be the PDS for the given product specifically, not merely a document from the same fund manager.
+   - Ignore cosmetic differences: hyphen vs en dash, "&" vs "and", capitalisation, extra whitespace, or a trailing class suffix such as "- Class A" or "(Wholesale)".
+   - A different option of the same fund (e.g. "Growth" vs "High Growth") is NOT a match; cap the score at 50 and say which name was found.
+3. APIR code check.
+   - APIR codes are three letters, four alphanumerics, then "AU" (e.g. ABC1234AU); they often sit in a table on page 1 or beside the product name.
+   - If the given APIR appears on the page, the check passes.
+   - If the page shows a different APIR against the matched product name, deduct 25 and name the code found.
+   - If no APIR is printed at all but the product name matches exactly, do not deduct; note "APIR missing" in the reason.
+4. Recency check.
+   - If the PDS date is after Jan 2023, no deduction.
+   - If before Jan 2023, deduct 25 points and mention the old date in the reason.
+5. Multi-Product Documents.
+   - One PDS can cover several products or options. If the given product is among them it is still valid; judge the date and APIR for that product.
+6. Document type check. The following are NOT a PDS even when they name the product; score 0 and name the type:
+   - Target Market Determination (TMD)
+   - Additional Application Form or application booklet
+   - Annual report, fund update, fact sheet or performance report
+   - Investment guide, reference guide or other incorporated-by-reference booklet
+   - Financial Services Guide (FSG) or Statement of Advice (SoA)
+   - A Supplementary PDS (SPDS) on its own, or a product update notice
+7. Scoring summary.
+   - 100: a PDS for the exact product, dated after Jan 2023, APIR matching or absent.
+   - 75: a valid PDS but dated before Jan 2023, or with a mismatched APIR.
+   - 50: a PDS where only part of the product name matches (wrong option or class).
+   - 25: a PDS from the right issuer but for a different product.
+   - 0: not a PDS at all.
+8. Extraction artifacts.
+   - The text comes from automated PDF extraction of page 1 only: expect broken line wrapping, repeated headers and footers, missing spaces between words, and table cells flattened into run-on lines.
+   - Do not penalise the document for these artifacts; reconstruct names, codes and dates across line breaks where the intent is clear (e.g. "Product Disclosure State-" / "ment", or an APIR split over two lines).
+   - Cover pages are sometimes mostly imagery; if only fragments of text survive but they include the product name and the words "Product Disclosure Statement", treat the document type as confirmed and judge the remaining checks on what is visible.
+9. Issuer vs product naming.
+   - Superannuation and managed-fund PDS covers often lead with the trustee or responsible entity ("XYZ Funds Management Limited") above the product name; never accept the issuer's name alone as a product match.
+   - Platform and wrap products may embed the product inside a menu name; the given product must still appear as an identifiable product title, not merely inside a list of available investments.
+10. Reason style.
+   - Reasons must be 20 words or fewer, plain text, and must not contain the "|" character.
+   - Name the failing check ("Old date", "APIR mismatch: XYZ1234AU", "Doc is a TMD") rather than describing the document at length.
+"""
+
+PDS_RULES = f"""Analyze the text in the user message to determine if it's a valid Product Disclosure Statement (PDS) for the given Product (and APIR code if present).
+{_PDS_CRITERIA}
+Response Format:
+  - 100 | PDS date: D Month YYYY
+  - or Score | Reason | PDS date: D Month YYYY
+  - If 100% certain, return only the score (100).
+  - If less than 100, return: <score> | <reason (<=20 words)>
+Worked examples:
+  - 100
+  - 100 | PDS date: 4 March 2024
+  - 75 | Old date | PDS date: 1 June 2021
+  - 75 | APIR mismatch: XYZ1234AU | PDS date: 12 September 2023
+  - 50 | Doc covers Balanced option, not High Growth | PDS date: 30 April 2024
+  - 25 | PDS is for a different fund of the same issuer | PDS date: 2 May 2023
+  - 0 | Doc is a Target Market Determination - not a PDS
+  - 0 | Doc is an Additional Application Form - not a PDS
+  - 0 | Doc is an annual report - not a PDS
+
+Important: Keep reason short & clear, use abbreviations if needed.
+"""
+
+PDS_RULES_BATCH = f"""You will receive several numbered items. For each item, analyze the text to determine if it's a valid Product Disclosure Statement (PDS) for the given Name (and APIR code if present).
+{_PDS_CRITERIA}
+Response Format:
+  - Output exactly one line per item, in item order, nothing else.
+  - Each line: #<item number> | <score> | <reason (<=20 words, empty if score is 100)> | PDS date: D Month YYYY
+Worked examples:
+  - #1 | 100 |  | PDS date: 4 March 2024
+  - #2 | 75 | Old date, APIR missing | PDS date: 1 June 2021
+  - #3 | 0 | Doc is a Target Market Determination - not a PDS |
+  - #4 | 50 | Doc covers Balanced option, not High Growth | PDS date: 30 April 2024
+  - #5 | 25 | PDS is for a different fund of the same issuer | PDS date: 2 May 2023
+  - #6 | 0 | Doc is an annual report - not a PDS |
+
+Important: Keep reasons short & clear, use abbreviations if needed.
+"""
+
+# Per-endpoint rate limits in requests/second: Google CSE allows 10 qps so
+# stay just under; arbitrary PDF hosts each get a generous budget; OpenAI
+# tier-1 RPM limits sit well above 20/s
+CSE_RATE = 9
+PDF_HOST_RATE = 50
+OPENAI_RATE = 20
+
+# AsyncLimiter instances can't be shared across event loops, so keep a
+# registry per loop (run_processing starts a fresh loop per upload)
+_limiters = weakref.WeakKeyDictionary()
+
+def _limiter_for(key, rate):
+    per_loop = _limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = per_loop.get(key)
+    if limiter is None:
+        limiter = per_loop[key] = AsyncLimiter(rate, 1)
+    return limiter
+
+async def _throttle(url):
+    """Token-bucket rate limiting per endpoint instead of sleeping between rows."""
+    host = urlparse(url).hostname or ""
+    if host == "www.googleapis.com":
+        await _limiter_for("cse", CSE_RATE).acquire()
+    else:
+        await _limiter_for(host, PDF_HOST_RATE).acquire()
+
+# Statuses worth retrying, mirroring urllib3.Retry's defaults for GETs
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+async def _get_with_retry(session, url, attempts=3, backoff=0.3, **kwargs):
+    """GET with exponential backoff on transient errors and retryable statuses."""
+    for attempt in range(attempts):
+        try:
+            response = await session.get(url, **kwargs)
+            if response.status in _RETRY_STATUSES and attempt < attempts - 1:
+                response.release()
+                await asyncio.sleep(backoff * (2 ** attempt))
+                continue
+            return response
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt))
 
 def map_columns(df):
     """Ensure consistent column mapping regardless of naming variations."""
@@ -25,79 +227,244 @@ def map_columns(df):
     mapped_columns = {col: expected_columns[i] for i, col in enumerate(df.columns[:4])}
     return df.rename(columns=mapped_columns)
 
+_MONTHS = {
+    m: m for m in (
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December",
+    )
+}
+
 def format_pds_date(date_str):
-    """Format date into 'D Month YYYY' format."""
+    """Format date into 'D Month YYYY' format (no leading zero on the day)."""
+    # Plain split + month lookup: strftime's %-d is POSIX-only (breaks on
+    # Windows) and strptime is needless overhead for this fixed shape
     try:
-        date_obj = datetime.strptime(date_str, "%d %B %Y")
-        return date_obj.strftime("%-d %B %Y")
-    except ValueError:
+        day, month, year = date_str.split()
+        return f"{int(day)} {_MONTHS[month.capitalize()]} {int(year)}"
+    except (ValueError, KeyError, AttributeError):
         return date_str  # Return as-is if the format isn't recognized
 
-def validate_pdf_with_ai(text, product_name, apir_code):
+async def _collect_stream_lines(stream, lines_needed):
+    """
+    Accumulate a streamed completion, closing the stream as soon as
+    lines_needed complete lines have arrived (or the stream ends).
+    """
+    content = ""
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                content += delta
+                if content.count("\n") >= lines_needed:
+                    break
+    finally:
+        await stream.close()
+    return content
+
+async def validate_pdf_with_ai(text, product_name, apir_code):
     """
-    Validate if the first page of a PDF matches PDS requirements 
+    Validate if the first page of a PDF matches PDS requirements
     using your AI logic, and extract the PDS date.
     """
+    cache_key = _ai_cache_key(text, product_name, apir_code)
+    cached = AI_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""Analyze this text to determine if it's a valid Product Disclosure Statement (PDS) for {product_name} ({apir_code}).
-Validation Criteria:
-1. Extract the PDS date.
-2. Product name must match exactly {product_name}.
-3. APIR code check must match {apir_code} if present.
-4. Recency check:
-   - If the PDS date is after Jan 2023, return 100.
-   - If before Jan 2023, deduct 25 points.
-5. Multi-Product Documents: If multiple product names exist, but {product_name} is present, it is still valid.
-Response Format:
-  - 100 | PDS date: D Month YYYY
-  - or Score | Reason | PDS date: D Month YYYY
-  - If 100% certain, return only the score (100).
-  - If less than 100, return: <score> | <reason (<=20 words)>
-  - Example: 75 | Old date, APIR missing
-  - Example: 0 | Doc is a Target Market Determination - not a PDS
-  - Example: 0 | Doc is an Additional Application Form - not a PDS
-                                         
-Important: Keep reason short & clear, use abbreviations if needed.
+        async with _limiter_for("openai", OPENAI_RATE):
+            stream = await client.chat.completions.create(
+                model="gpt-4o-mini-2024-07-18",
+                messages=[
+                    {"role": "system", "content": PDS_RULES},
+                    {"role": "user", "content": f"Product: {product_name}\nAPIR: {apir_code}\n---\n{_truncate_tokens(text)}"}
+                ],
+                stream=True,
+                max_tokens=80,
+            )
+        # Only the first line matters; stop reading as soon as it's complete
+        # instead of waiting out any extra explanation the model tacks on
+        content = await _collect_stream_lines(stream, 1)
 
-"""
-                },
-                {"role": "user", "content": text[:15000]}  # truncate for safety
-            ]
-        )
-
-        content = response.choices[0].message.content.strip()
-        # Attempt to parse the custom response format
-        match = re.match(r"(\d+)\s*\|\s*([^|]*)\s*\|\s*PDS date:\s*(\d{1,2} [A-Za-z]+ \d{4})", content)
-        if match:
-            return int(match.group(1)), match.group(2).strip(), format_pds_date(match.group(3))
-        # Check for the 100-score pattern
-        match_100 = re.match(r"100\s*\|\s*PDS date:\s*(\d{1,2} [A-Za-z]+ \d{4})", content)
-        if match_100:
-            return 100, "", format_pds_date(match_100.group(1))
+        content = content.split("\n", 1)[0].strip()
+        # The format is always pipe-delimited, so a plain split covers every
+        # variant (bare score, score|reason, score|reason|date, score|date)
+        # without running a chain of regexes per response
+        parts = [p.strip() for p in content.split("|", 2)]
+        if parts[0].isdigit():
+            score = int(parts[0])
+            reason, pds_date = "", ""
+            for part in parts[1:]:
+                if part.startswith("PDS date:"):
+                    pds_date = part.partition(":")[2].strip()
+                elif part:
+                    reason = part
+            result = (score, reason, format_pds_date(pds_date) if pds_date else "")
+            AI_CACHE.set(cache_key, result, expire=CACHE_TTL)
+            return result
         return 0, "Invalid AI response", ""
     except Exception as e:
         return 0, f"Error: {e}", ""
 
-def extract_pdf_text_first_page(url):
-    """Extract text from the first page of a PDF (download from URL)."""
-    headers = {"User-Agent": "Mozilla/5.0", "Accept": "application/pdf", "Referer": url}
+async def validate_pdf_batch(items):
+    """
+    Validate several PDF first pages in a single OpenAI call.
+    `items` is a list of (text, product_name, apir_code) tuples; returns a
+    list of (score, reason, pds_date) tuples aligned with `items`.
+    Items the model fails to answer fall back to per-item validation.
+    """
+    parsed = {}
+    misses = []
+    for i, (text, product_name, apir_code) in enumerate(items, start=1):
+        cached = AI_CACHE.get(_ai_cache_key(text, product_name, apir_code))
+        if cached is not None:
+            parsed[i] = cached
+        else:
+            misses.append((i, text, product_name, apir_code))
+
+    if misses:
+        try:
+            user_content = "\n\n".join(
+                f"### Item {i}\nName: {product_name}\nAPIR: {apir_code}\nText: {_truncate_tokens(text)}"
+                for i, text, product_name, apir_code in misses
+            )
+            async with _limiter_for("openai", OPENAI_RATE):
+                stream = await client.chat.completions.create(
+                    model="gpt-4o-mini-2024-07-18",
+                    messages=[
+                        {"role": "system", "content": PDS_RULES_BATCH},
+                        {"role": "user", "content": user_content}
+                    ],
+                    stream=True,
+                    max_tokens=80 * len(misses),
+                )
+            # One line per item; stop reading once they have all arrived
+            content = (await _collect_stream_lines(stream, len(misses))).strip()
+            keys = {i: _ai_cache_key(text, product_name, apir_code)
+                    for i, text, product_name, apir_code in misses}
+            for line in content.splitlines():
+                match = _RE_BATCH_LINE.fullmatch(line.strip())
+                if not match:
+                    continue
+                idx, score, reason, rest = match.groups()
+                i = int(idx)
+                if i in keys and i not in parsed:
+                    pds_date = rest.split("PDS date:", 1)[-1].strip() if "PDS date:" in rest else ""
+                    parsed[i] = (int(score), reason.strip(), format_pds_date(pds_date) if pds_date else "")
+                    AI_CACHE.set(keys[i], parsed[i], expire=CACHE_TTL)
+        except Exception as e:
+            print(f"Batch validation error: {e}")
+
+    # Fall back to single-item validation for anything the batch missed
+    fallbacks = {
+        i: validate_pdf_with_ai(text, product_name, apir_code)
+        for i, text, product_name, apir_code in misses
+        if i not in parsed
+    }
+    if fallbacks:
+        done = await asyncio.gather(*fallbacks.values())
+        parsed.update(zip(fallbacks.keys(), done))
+    return [parsed[i] for i in range(1, len(items) + 1)]
+
+def _extract_first_page(data):
+    """First-page text only; flags=0 skips ligature/whitespace/image processing."""
     try:
-        response = requests.get(url, headers=headers, timeout=15, verify=False)
-        if response.status_code == 200 and 'application/pdf' in response.headers.get('Content-Type', ''):
-            with fitz.open(stream=response.content, filetype="pdf") as doc:
-                if len(doc) > 0:
-                    return doc[0].get_text()
-    except Exception as e:
-        print(f"Error extracting PDF: {e}")
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            if len(doc) > 0:
+                return doc.load_page(0).get_text("text", flags=0)
+    except Exception:
+        pass  # typically a truncated xref from a range-limited fetch
     return ""
 
-def search_google_for_pds(product_name, apir_code):
+# PDF parsing is CPU-bound C code that releases the GIL, so a thread pool
+# gets real parallelism without pickling megabytes of PDF bytes to worker
+# processes, and keeps big parses from stalling the event loop
+_PARSE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+async def _extract_first_page_async(data):
+    return await asyncio.get_running_loop().run_in_executor(_PARSE_POOL, _extract_first_page, data)
+
+async def fetch_and_extract(session, url, dest_path):
+    """
+    Fetch just enough of a PDF to extract its first-page text.
+    Asks for the first PDF_RANGE_BYTES with an HTTP Range request; most
+    servers honour it (206) and page 1 parses from the partial bytes. If
+    the server ignores the range (200), the full body is teed to dest_path
+    like a normal download; if the partial bytes don't parse (truncated
+    xref), the whole file is fetched once instead. Returns (text,
+    downloaded) where `downloaded` says the complete file is at dest_path.
+    """
+    headers = {"Referer": url, "Range": f"bytes=0-{PDF_RANGE_BYTES}"}
+    try:
+        await _throttle(url)
+        async with await _get_with_retry(session, url, headers=headers,
+                                         timeout=aiohttp.ClientTimeout(total=15)) as response:
+            if 'application/pdf' not in response.headers.get('Content-Type', ''):
+                return "", False
+            if response.status == 206:
+                text = await _extract_first_page_async(await response.read())
+                if text:
+                    return text, False
+                # fall through to a full fetch below
+            elif response.status == 200:
+                buf = BytesIO()
+                with open(dest_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(1 << 15):
+                        if chunk:
+                            f.write(chunk)
+                            buf.write(chunk)
+                return await _extract_first_page_async(buf.getvalue()), True
+            else:
+                return "", False
+    except Exception as e:
+        print(f"Error fetching PDF: {e}")
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+        return "", False
+    return await _full_fetch_and_extract(session, url, dest_path)
+
+async def _full_fetch_and_extract(session, url, dest_path):
+    """Download a whole PDF, teeing bytes to dest_path and to the parser."""
+    try:
+        await _throttle(url)
+        async with await _get_with_retry(session, url, headers={"Referer": url},
+                                         timeout=aiohttp.ClientTimeout(total=15)) as response:
+            if response.status != 200 or 'application/pdf' not in response.headers.get('Content-Type', ''):
+                return "", False
+            buf = BytesIO()
+            with open(dest_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(1 << 15):
+                    if chunk:
+                        f.write(chunk)
+                        buf.write(chunk)
+        return await _extract_first_page_async(buf.getvalue()), True
+    except Exception as e:
+        print(f"Error fetching PDF: {e}")
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+        return "", False
+
+async def _download_pdf(session, url, dest_path):
+    """Stream a full PDF to dest_path (for rows validated off a range fetch)."""
+    try:
+        await _throttle(url)
+        async with await _get_with_retry(session, url, headers={"Referer": url},
+                                         timeout=aiohttp.ClientTimeout(total=15)) as response:
+            response.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(1 << 15):
+                    if chunk:
+                        f.write(chunk)
+    except Exception as e:
+        print(f"Error downloading PDF: {e}")
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+
+async def search_google_for_pds(session, product_name, apir_code):
     """Search Google for the top PDS result by given product name + APIR code."""
+    cache_key = (product_name, apir_code)
+    cached = CSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
     query = (
         f'"{product_name}" "{apir_code}" "Product Disclosure Statement" filetype:pdf'
         if apir_code else
@@ -106,58 +473,171 @@ def search_google_for_pds(product_name, apir_code):
     url = "https://www.googleapis.com/customsearch/v1"
     params = {'key': GOOGLE_API_KEY, 'cx': CSE_ID, 'q': query, 'fileType': 'pdf', 'num': 1}
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        results = response.json()
-        if 'items' in results and results['items']:
-            return results['items'][0]['link']
+        await _throttle(url)
+        async with await _get_with_retry(session, url, params=params) as response:
+            response.raise_for_status()
+            results = await response.json()
+        link = results['items'][0]['link'] if results.get('items') else ""
+        # Cache any well-formed answer (including "no hits"); errors below
+        # stay uncached so transient failures can be retried on a re-run
+        CSE_CACHE.set(cache_key, link, expire=CACHE_TTL)
+        return link
     except Exception as e:
         print(f"Google search error: {e}")
     return ""
 
-def download_pdf_file(url, product_name, download_folder):
+async def _process_rows(data, download_folder, zipf, zip_lock):
     """
-    Download a PDF from the URL, rename it to match the product name,
-    and store it in download_folder.
+    Process all rows through a three-stage pipeline linked by queues:
+      1. Google search (bounded by SEARCH_CONCURRENCY)
+      2. PDF fetch + first-page extraction (MAX_CONCURRENT_ROWS workers)
+      3. AI validation, batched VALIDATION_BATCH_SIZE rows per call,
+         then full download / cleanup depending on the score
+    Queues between the stages mean PDF fetches start as soon as the first
+    search result is known instead of waiting for the whole search phase.
+    Valid PDFs are appended to the already-open `zipf` as they land.
     """
-    safe_product_name = re.sub(r'[\\/*?:"<>|]', "", product_name)
-    file_path = os.path.join(download_folder, f"{safe_product_name}.pdf")
-    headers = {"User-Agent": "Mozilla/5.0", "Accept": "application/pdf", "Referer": url}
-    try:
-        response = requests.get(url, headers=headers, timeout=15, verify=False, stream=True)
-        response.raise_for_status()
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        return file_path
-    except Exception as e:
-        print(f"Error downloading PDF for '{product_name}': {e}")
-        return None
+    search_sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    fetch_queue = asyncio.Queue()
+    validate_queue = asyncio.Queue()
+    results = {}
 
-def process_row(row, download_folder):
-    """
-    Process one row of data:
-      - search Google
-      - extract PDF text
-      - run AI validation
-      - if valid, download the PDF
-    """
-    product_name = row['Product name'].strip()
-    apir_code = str(row['APIR code']).strip() if pd.notna(row['APIR code']) else None
-    pdf_url = search_google_for_pds(product_name, apir_code)
-    if not pdf_url:
-        return "Not found", 0, "No PDF", ""
+    # SoA extracts often list the same product on many client rows. Rows with
+    # the same normalized (product, APIR) resolve identically, so run the
+    # pipeline once per unique key and fan the result out afterwards; rows
+    # within a group share the group's single result and downloaded file.
+    # map_columns pins the column order: row = (index, APIR code, Product name, ...)
+    groups = {}
+    for row in data.itertuples(index=True, name=None):
+        if pd.isna(row[2]):
+            continue
+        apir_code = row[1] if pd.notna(row[1]) else None
+        key = (row[2].lower(), apir_code.upper() if apir_code else None)
+        groups.setdefault(key, []).append((row[0], row[2], apir_code))
 
-    text = extract_pdf_text_first_page(pdf_url)
-    if not text:
-        return "Not found", 0, "No text extracted", ""
+    # One destination file per group, assigned up front: the APIR suffix
+    # separates same-named products, and the counter separates names that
+    # collide only after sanitization. Two concurrent fetch workers must
+    # never tee chunks into the same path.
+    group_paths = {}
+    taken = set()
+    for key, rows in groups.items():
+        path = _safe_pdf_path(download_folder, rows[0][1], rows[0][2])
+        base, n = path, 2
+        while path in taken:
+            path = f"{base[:-len('.pdf')]} ({n}).pdf"
+            n += 1
+        taken.add(path)
+        group_paths[key] = path
+    # One pooled session for the whole run: keep-alive connections are reused
+    # across rows (Google CSE is always the same host, and many PDS PDFs sit
+    # on the same fund-manager CDN), so repeat hosts skip the TCP+TLS handshake.
+    connector = aiohttp.TCPConnector(limit=32, limit_per_host=8, ssl=False,
+                                     ttl_dns_cache=300)
+    headers = {"User-Agent": "Mozilla/5.0", "Accept": "application/pdf"}
+    seen_hosts = set()
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        async def search_one(index, product_name, apir_code, file_path):
+            async with search_sem:
+                pdf_url = await search_google_for_pds(session, product_name, apir_code)
+            if not pdf_url:
+                results[index] = ("Not found", 0, "No PDF", "")
+            else:
+                # Unique fund-manager hosts dominate first-connection cost, so
+                # pre-resolve each new host while its URL waits in the queue
+                host = urlparse(pdf_url).hostname
+                if host and host not in seen_hosts:
+                    seen_hosts.add(host)
+                    asyncio.get_running_loop().run_in_executor(None, _resolve_quietly, host)
+                await fetch_queue.put((index, product_name, apir_code, pdf_url, file_path))
 
-    score, reason, pds_date = validate_pdf_with_ai(text, product_name, apir_code)
-    if score == 100 and pdf_url != "Not found":
-        pdf_file_path = download_pdf_file(pdf_url, product_name, download_folder)
-        # pdf_file_path is appended in main loop
-    return pdf_url, score, reason, pds_date
+        async def fetch_worker():
+            while True:
+                item = await fetch_queue.get()
+                if item is None:
+                    break
+                index, product_name, apir_code, pdf_url, file_path = item
+                text, downloaded = await fetch_and_extract(session, pdf_url, file_path)
+                if not text:
+                    results[index] = ("Not found", 0, "No text extracted", "")
+                    if downloaded and os.path.exists(file_path):
+                        os.unlink(file_path)
+                    continue
+                # Cheap pre-filter: pages with no PDS marker at all (TMDs,
+                # application forms, fact sheets) aren't worth an OpenAI call
+                low = text.lower()
+                if ("product disclosure statement" not in low and "pds" not in low
+                        and (not apir_code or apir_code.lower() not in low)):
+                    results[index] = (pdf_url, 0, "No PDS marker on page 1", "")
+                    if downloaded and os.path.exists(file_path):
+                        os.unlink(file_path)
+                else:
+                    await validate_queue.put((index, product_name, apir_code, pdf_url, text, file_path, downloaded))
+
+        def zip_add(path):
+            with zip_lock:
+                zipf.write(path, arcname=os.path.basename(path))
+
+        async def download_and_zip(pdf_url, file_path):
+            await _download_pdf(session, pdf_url, file_path)
+            if os.path.exists(file_path):
+                zip_add(file_path)
+
+        downloads = []
+
+        async def flush_batch(batch):
+            outputs = await validate_pdf_batch(
+                [(text, product_name, apir_code) for _, product_name, apir_code, _, text, _, _ in batch]
+            )
+            for (index, product_name, apir_code, pdf_url, text, file_path, downloaded), (score, reason, pds_date) in zip(batch, outputs):
+                results[index] = (pdf_url, score, reason, pds_date)
+                if score == 100:
+                    if downloaded:
+                        zip_add(file_path)
+                    else:
+                        # Rows validated off a range fetch still need the full file
+                        downloads.append(asyncio.create_task(download_and_zip(pdf_url, file_path)))
+                elif downloaded and os.path.exists(file_path):
+                    os.unlink(file_path)
+
+        async def validator():
+            batch = []
+            flushes = []
+            while True:
+                item = await validate_queue.get()
+                if item is None:
+                    break
+                batch.append(item)
+                if len(batch) >= VALIDATION_BATCH_SIZE:
+                    flushes.append(asyncio.create_task(flush_batch(batch)))
+                    batch = []
+            if batch:
+                flushes.append(asyncio.create_task(flush_batch(batch)))
+            if flushes:
+                await asyncio.gather(*flushes)
+
+        fetchers = [asyncio.create_task(fetch_worker()) for _ in range(MAX_CONCURRENT_ROWS)]
+        validator_task = asyncio.create_task(validator())
+
+        await asyncio.gather(*[
+            search_one(*rows[0], group_paths[key])
+            for key, rows in groups.items()
+        ])
+        for _ in fetchers:
+            await fetch_queue.put(None)
+        await asyncio.gather(*fetchers)
+        await validate_queue.put(None)
+        await validator_task
+        if downloads:
+            await asyncio.gather(*downloads)
+
+    # Fan each unique result out to its duplicate rows
+    for rows in groups.values():
+        first = results.get(rows[0][0])
+        if first is not None:
+            for row in rows[1:]:
+                results[row[0]] = first
+    return results
 
 
 def run_processing(input_excel_path):
@@ -175,51 +655,59 @@ def run_processing(input_excel_path):
     zip_output_path = os.path.join(os.getcwd(), f"Valid_PDS_PDFs_{timestamp}.zip")
     os.makedirs(download_folder, exist_ok=True)
 
-    # Read input Excel
-    data = pd.read_excel(input_excel_path)
+    # Read input Excel; calamine skips the style/formula parsing the default
+    # openpyxl reader does per cell. dtype=str (column names vary before
+    # map_columns) also keeps APIR codes as strings up front.
+    data = pd.read_excel(input_excel_path, engine="calamine", dtype=str)
     data = map_columns(data)
 
-    # Prepare output columns
-    data['Web link'] = ""
-    data['Validity Score'] = 0
-    data['Validation Reason'] = ""
-    data['PDS date'] = ""
+    # Normalize the key columns once through pandas' C string paths, so the
+    # pipeline never calls .strip()/str()/pd.notna() per row (missing cells
+    # become pd.NA, which itertuples passes through)
+    data['Product name'] = data['Product name'].astype("string").str.strip()
+    data['APIR code'] = data['APIR code'].astype("string").str.strip()
 
-    downloaded_files = []
+    # Open the ZIP up front so valid PDFs stream into it as they land.
+    # ZIP_STORED: PDFs already hold FlateDecode streams, so deflating them
+    # again would burn CPU for ~0% size reduction.
+    zipf = zipfile.ZipFile(zip_output_path, "w", compression=zipfile.ZIP_STORED)
+    zip_lock = threading.Lock()
 
-    # Process each row
-    for index, row in data.iterrows():
-        # Basic safety check
-        if pd.isna(row['Product name']):
-            continue
+    # Process all rows concurrently, then write results back in bulk:
+    # filling plain lists and assigning whole columns once avoids a
+    # label lookup + dtype check per cell that .at would cost per row
+    try:
+        results = asyncio.run(_process_rows(data, download_folder, zipf, zip_lock))
+    finally:
+        has_pdfs = bool(zipf.namelist())
+        zipf.close()
+    web_links = [""] * len(data)
+    scores = [0] * len(data)
+    reasons = [""] * len(data)
+    dates = [""] * len(data)
+    for index, (pdf_url, score, reason, pds_date) in results.items():
+        web_links[index] = pdf_url
+        scores[index] = score
+        reasons[index] = reason
+        dates[index] = pds_date
 
-        pdf_url, score, reason, pds_date = process_row(row, download_folder)
-        data.at[index, 'Web link'] = pdf_url
-        data.at[index, 'Validity Score'] = score
-        data.at[index, 'Validation Reason'] = reason
-        data.at[index, 'PDS date'] = pds_date
-
-        # If valid, we assume it was downloaded
-        if score == 100 and pdf_url != "Not found":
-            # Construct what the downloaded PDF path would be
-            safe_product_name = re.sub(r'[\\/*?:"<>|]', "", row['Product name'])
-            pdf_file_path = os.path.join(download_folder, f"{safe_product_name}.pdf")
-            if os.path.exists(pdf_file_path):
-                downloaded_files.append(pdf_file_path)
-        time.sleep(0.5)
+    data['Web link'] = web_links
+    data['Validity Score'] = scores
+    data['Validation Reason'] = reasons
+    data['PDS date'] = dates
 
     # Save the completed Excel file (in the current working directory, with timestamp)
     output_excel_path = os.path.join(os.getcwd(), f"Processed_{timestamp}.xlsx")
-    data.to_excel(output_excel_path, index=False)
+    # No constant_memory here: pandas emits cells column-major, and that mode
+    # flushes each row once a later one is touched, silently dropping most of
+    # the sheet. Plain xlsxwriter is still faster than the openpyxl default.
+    data.to_excel(output_excel_path, index=False, engine="xlsxwriter")
     print(f"Processing complete! Excel file saved at: {output_excel_path}")
 
-    # Zip the downloaded PDFs if any valid ones were downloaded
-    if downloaded_files:
-        with zipfile.ZipFile(zip_output_path, 'w') as zipf:
-            for file in downloaded_files:
-                zipf.write(file, arcname=os.path.basename(file))
+    # The ZIP was filled during processing; drop it if nothing validated
+    if has_pdfs:
         print(f"All valid PDFs have been zipped into: {zip_output_path}")
         return output_excel_path, zip_output_path
 
-    # If no PDFs, return just the Excel
+    os.unlink(zip_output_path)
     return output_excel_path, None